@@ -3,12 +3,57 @@ Appointment Service - Backend Logic for EMR Appointment Management
 This simulates a Lambda function that would interact with Aurora PostgreSQL via AppSync/GraphQL
 """
 
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-import uuid
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+from secrets import token_hex
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass(slots=True)
+class Appointment:
+    """
+    In-memory appointment row
+
+    Slotted attribute access is a single offset load instead of a per-access
+    hash lookup, and each row is a fraction of the size of an 8-key dict.
+    to_dict() produces the dict shape the API returns.
+    """
+    id: str
+    patientName: str
+    date: str
+    time: str
+    duration: int
+    doctorName: str
+    status: str
+    mode: str
+    # Derived fields cached for the hot loops
+    _start_min: int = 0
+    _end_min: int = 0
+    _doctorName_lower: str = ""
+
+    def to_dict(self) -> Dict:
+        """Dict form for the API/JSON boundary"""
+        return {
+            "id": self.id,
+            "patientName": self.patientName,
+            "date": self.date,
+            "time": self.time,
+            "duration": self.duration,
+            "doctorName": self.doctorName,
+            "status": self.status,
+            "mode": self.mode
+        }
+
 
 # Mock database - In production, this would be Aurora PostgreSQL
-APPOINTMENTS_DB = [
+_SEED_ROWS = [
     {
         "id": "apt-001",
         "patientName": "John Smith",
@@ -131,8 +176,145 @@ APPOINTMENTS_DB = [
     }
 ]
 
+APPOINTMENTS_DB: List[Appointment] = [Appointment(**row) for row in _SEED_ROWS]
+del _SEED_ROWS
+
+# Hash index for O(1) lookups by id - In production, this is the primary key
+# index that Aurora PostgreSQL maintains on appointments.id
+_BY_ID: Dict[str, Appointment] = {apt.id: apt for apt in APPOINTMENTS_DB}
+
+# Position of each appointment in APPOINTMENTS_DB, so deletes can swap the
+# last row into the vacated slot instead of shifting the tail. The list is
+# therefore unordered storage; ordering lives in the sorted view.
+_POS_BY_ID: Dict[str, int] = {apt.id: i for i, apt in enumerate(APPOINTMENTS_DB)}
+
+# Statuses that do not block a doctor's time slot
+_INACTIVE = frozenset({"Cancelled", "Completed"})
+
+# Responses for client-supplied idempotency keys, so a retried create
+# returns the original appointment in one dict lookup instead of re-running
+# validation and the conflict check (and instead of double-booking).
+# Oldest entries are evicted at the size cap; production would use the
+# idempotency_keys table with a 24h TTL described at the bottom of this file.
+_IDEMPOTENCY: "OrderedDict[str, Dict]" = OrderedDict()
+_IDEMPOTENCY_MAX = 10000
+
+# Mutation locks sharded by doctor. The GIL protects single dict/list ops
+# but not multi-step sequences like conflict-check-then-insert, where two
+# threads could both pass the check and double-book. Sharding by doctor
+# serializes writes that can actually conflict while letting bookings for
+# different doctors proceed in parallel.
+_DOCTOR_LOCKS: Dict[str, threading.RLock] = defaultdict(threading.RLock)
+
+# Generation counter for the query cache: every successful mutation bumps
+# it, so cached results for older generations simply stop being hit and
+# age out of the LRU
+_DB_VERSION = 0
+
+
+def _bump_version() -> None:
+    global _DB_VERSION
+    _DB_VERSION += 1
+
+
+# Validation constants, built once instead of per call. The precompiled
+# patterns replace strptime, which interprets its format string on every
+# call; the time pattern also enforces the zero-padded HH:MM form the
+# lexicographic ordering in the sorted view relies on.
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_TIME_RE = re.compile(r"^([01]\d|2[0-3]):[0-5]\d$")
+_REQUIRED_FIELDS = ("patientName", "date", "time", "duration", "doctorName", "mode")
+_VALID_STATUSES = frozenset({"Confirmed", "Scheduled", "Upcoming", "Cancelled", "Completed"})
+_VALID_STATUSES_MSG = "Invalid status. Must be one of: " + ", ".join(sorted(_VALID_STATUSES))
+
+def _sort_key(apt: Appointment) -> Tuple[str, str]:
+    """Ordering key for query results: (date, time)"""
+    return (apt.date, apt.time)
+
+
+# Appointments kept permanently ordered by (date, time), so queries never
+# re-sort. Inserts are O(log n) via bisect; zero-padded dates and times
+# compare lexicographically in chronological order.
+_SORTED: List[Appointment] = []
+
+
+def _sorted_remove(apt: Appointment) -> None:
+    """Remove an appointment from the sorted view"""
+    position = bisect_left(_SORTED, _sort_key(apt), key=_sort_key)
+    while _SORTED[position] is not apt:
+        position += 1
+    del _SORTED[position]
+
+
+def _to_minutes(time: str) -> int:
+    """
+    Zero-padded HH:MM as minutes since midnight. Conversion happens only
+    where duration arithmetic needs it; equality and ordering use the
+    strings directly, since zero-padded dates and times compare
+    lexicographically in chronological order.
+    """
+    h, m = map(int, time.split(":"))
+    return h * 60 + m
+
+
+def _set_derived_fields(apt: Appointment) -> None:
+    """Cache fields reused by hot loops: minute bounds and lower-cased name"""
+    apt._start_min = _to_minutes(apt.time)
+    apt._end_min = apt._start_min + apt.duration
+    apt._doctorName_lower = apt.doctorName.lower()
+
+
+# Interval index for conflict detection: per (doctorName, date), packed
+# int arrays of start/end minutes sorted by start plus a parallel list of
+# the appointments. Only slot-blocking appointments are indexed.
+_INTERVALS: Dict[Tuple[str, str], Tuple[array, array, List[Appointment]]] = {}
+
 
-def get_appointments(filters: Optional[Dict] = None) -> List[Dict]:
+def _first_overlap(starts: array, ends: array, new_start: int, new_end: int) -> int:
+    """
+    Index of the first stored interval overlapping [new_start, new_end),
+    or -1. Kept as straight integer compares over the packed arrays - no
+    attribute or dict access in the loop body - which is also the shape a
+    JIT compiler could take as-is.
+    """
+    for i in range(len(starts)):
+        if new_start < ends[i] and new_end > starts[i]:
+            return i
+    return -1
+
+
+def _intervals_add(apt: Appointment) -> None:
+    """Insert an active appointment into the interval index"""
+    starts, ends, apts = _INTERVALS.setdefault(
+        (apt.doctorName, apt.date), (array("i"), array("i"), [])
+    )
+    position = bisect_left(starts, apt._start_min)
+    starts.insert(position, apt._start_min)
+    ends.insert(position, apt._end_min)
+    apts.insert(position, apt)
+
+
+def _intervals_remove(apt: Appointment) -> None:
+    """Remove an appointment from the interval index"""
+    starts, ends, apts = _INTERVALS[(apt.doctorName, apt.date)]
+    position = bisect_left(starts, apt._start_min)
+    while apts[position] is not apt:
+        position += 1
+    del starts[position]
+    del ends[position]
+    del apts[position]
+
+
+for _apt in APPOINTMENTS_DB:
+    _set_derived_fields(_apt)
+    if _apt.status not in _INACTIVE:
+        _intervals_add(_apt)
+del _apt
+_SORTED.extend(sorted(APPOINTMENTS_DB, key=_sort_key))
+
+
+def get_appointments(filters: Optional[Dict] = None, *,
+                     limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
     """
     Query function to fetch appointments with optional filtering
     
@@ -161,31 +343,52 @@ def get_appointments(filters: Optional[Dict] = None) -> List[Dict]:
     
     Args:
         filters: Dictionary with optional keys: date, status, doctorName
-        
+        limit: Maximum number of rows to return (None for all)
+        offset: Number of matching rows to skip before the first returned
+
     Returns:
         List of appointment dictionaries matching the filters
     """
     if filters is None:
         filters = {}
-    
-    result = APPOINTMENTS_DB.copy()
-    
-    # Filter by date if provided
-    if "date" in filters and filters["date"]:
-        result = [apt for apt in result if apt["date"] == filters["date"]]
-    
-    # Filter by status if provided
-    if "status" in filters and filters["status"]:
-        result = [apt for apt in result if apt["status"] == filters["status"]]
-    
-    # Filter by doctor name if provided
-    if "doctorName" in filters and filters["doctorName"]:
-        result = [apt for apt in result if filters["doctorName"].lower() in apt["doctorName"].lower()]
-    
-    # Sort by date and time
-    result.sort(key=lambda x: (x["date"], x["time"]))
-    
-    return result
+
+    date = filters.get("date") or None
+    status = filters.get("status") or None
+    doctor = filters.get("doctorName")
+    needle = doctor.lower() if doctor else None
+
+    # Dashboards re-request the same filter combinations in bursts; the
+    # version key invalidates the memo on any mutation
+    return list(_get_appointments_cached(_DB_VERSION, date, status, needle, limit, offset))
+
+
+@lru_cache(maxsize=256)
+def _get_appointments_cached(
+    version: int, date: Optional[str], status: Optional[str], needle: Optional[str],
+    limit: Optional[int], offset: int
+) -> Tuple[Dict, ...]:
+    """Memoized query body, keyed on the normalized filters and DB version"""
+    # Narrow to the requested date range in the sorted view first - the most
+    # selective predicate - so the remaining filters only see that slice;
+    # results come back already ordered, so there is no per-query sort
+    if date:
+        lo = bisect_left(_SORTED, (date, ""), key=_sort_key)
+        hi = bisect_left(_SORTED, (date, "\uffff"), key=_sort_key)
+        candidates = islice(_SORTED, lo, hi)
+    else:
+        candidates = _SORTED
+
+    # Single fused lazy pass with short-circuiting predicates, cheapest
+    # equality test before the substring match; rows cross the API boundary
+    # as dicts. islice stops the scan as soon as the page is full, so a
+    # 20-row page costs 20 matches of work, not the full result set.
+    matches = (
+        apt.to_dict() for apt in candidates
+        if (status is None or apt.status == status)
+        and (needle is None or needle in apt._doctorName_lower)
+    )
+    stop = None if limit is None else offset + limit
+    return tuple(islice(matches, offset, stop))
 
 
 def create_appointment(payload: Dict) -> Dict:
@@ -218,79 +421,108 @@ def create_appointment(payload: Dict) -> Dict:
       }
     
     Args:
-        payload: Dictionary with required keys: patientName, date, time, 
-                duration, doctorName, mode. Optional: status
-    
+        payload: Dictionary with required keys: patientName, date, time,
+                duration, doctorName, mode. Optional: status, idempotency_key
+                (retries carrying the same key return the original response)
+
     Returns:
         Created appointment dictionary
         
     Raises:
         ValueError: If validation fails or time conflict exists
     """
+    # A retried request short-circuits to the stored response before any
+    # validation or conflict work
+    idempotency_key = payload.get("idempotency_key")
+    if idempotency_key is not None:
+        cached = _IDEMPOTENCY.get(idempotency_key)
+        if cached is not None:
+            return cached
+
     # Validate required fields
-    required_fields = ["patientName", "date", "time", "duration", "doctorName", "mode"]
-    for field in required_fields:
+    for field in _REQUIRED_FIELDS:
         if field not in payload or not payload[field]:
             raise ValueError(f"Missing required field: {field}")
     
-    # Validate date format
+    # Validate date format; the regex checks the shape, the datetime
+    # constructor (much cheaper than strptime) checks calendar validity
+    if not _DATE_RE.match(payload["date"]):
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
+    year, month, day = map(int, payload["date"].split("-"))
     try:
-        appointment_date = datetime.strptime(payload["date"], "%Y-%m-%d")
+        datetime(year, month, day)
     except ValueError:
         raise ValueError("Invalid date format. Use YYYY-MM-DD")
-    
+
     # Validate time format
-    try:
-        appointment_time = datetime.strptime(payload["time"], "%H:%M")
-    except ValueError:
+    if not _TIME_RE.match(payload["time"]):
         raise ValueError("Invalid time format. Use HH:MM")
-    
+
     # Validate duration
     if not isinstance(payload["duration"], int) or payload["duration"] <= 0:
         raise ValueError("Duration must be a positive integer (minutes)")
     
-    # Check for time conflicts with the same doctor
-    conflict = check_time_conflict(
-        payload["doctorName"],
-        payload["date"],
-        payload["time"],
-        payload["duration"]
-    )
-    
-    if conflict:
-        raise ValueError(
-            f"Time conflict detected. Dr. {payload['doctorName']} has an appointment "
-            f"at {conflict['time']} on {conflict['date']}"
+    # Hold this doctor's lock across conflict-check-then-insert so two
+    # concurrent writers cannot both pass the check and double-book
+    with _DOCTOR_LOCKS[payload["doctorName"]]:
+        # Check for time conflicts with the same doctor
+        conflict = check_time_conflict(
+            payload["doctorName"],
+            payload["date"],
+            payload["time"],
+            payload["duration"]
         )
-    
-    # Generate unique ID (in production, Aurora would auto-generate)
-    new_id = f"apt-{str(uuid.uuid4())[:8]}"
-    
-    # Set default status if not provided
-    status = payload.get("status", "Scheduled")
-    
-    # Create new appointment
-    new_appointment = {
-        "id": new_id,
-        "patientName": payload["patientName"],
-        "date": payload["date"],
-        "time": payload["time"],
-        "duration": payload["duration"],
-        "doctorName": payload["doctorName"],
-        "status": status,
-        "mode": payload["mode"]
-    }
-    
-    # Add to mock database
-    APPOINTMENTS_DB.append(new_appointment)
-    
+
+        if conflict:
+            raise ValueError(
+                f"Time conflict detected. Dr. {payload['doctorName']} has an appointment "
+                f"at {conflict.time} on {conflict.date}"
+            )
+
+        # Generate unique ID (in production, Aurora would auto-generate).
+        # 4 random bytes give the same 8 hex chars the uuid4 slice produced;
+        # probe the id index and retry on the (rare) collision.
+        new_id = f"apt-{token_hex(4)}"
+        while new_id in _BY_ID:
+            new_id = f"apt-{token_hex(4)}"
+
+        # Set default status if not provided
+        status = payload.get("status", "Scheduled")
+
+        # Create new appointment
+        new_appointment = Appointment(
+            id=new_id,
+            patientName=payload["patientName"],
+            date=payload["date"],
+            time=payload["time"],
+            duration=payload["duration"],
+            doctorName=payload["doctorName"],
+            status=status,
+            mode=payload["mode"]
+        )
+
+        # Add to mock database
+        _set_derived_fields(new_appointment)
+        _POS_BY_ID[new_id] = len(APPOINTMENTS_DB)
+        APPOINTMENTS_DB.append(new_appointment)
+        _BY_ID[new_id] = new_appointment
+        if new_appointment.status not in _INACTIVE:
+            _intervals_add(new_appointment)
+        insort(_SORTED, new_appointment, key=_sort_key)
+        _bump_version()
+
     # In production: This would trigger AppSync subscription notification
     # subscription OnAppointmentCreated would push this to all connected clients
-    
-    return new_appointment
+
+    response = new_appointment.to_dict()
+    if idempotency_key is not None:
+        _IDEMPOTENCY[idempotency_key] = response
+        if len(_IDEMPOTENCY) > _IDEMPOTENCY_MAX:
+            _IDEMPOTENCY.popitem(last=False)
+    return response
 
 
-def check_time_conflict(doctor_name: str, date: str, time: str, duration: int) -> Optional[Dict]:
+def check_time_conflict(doctor_name: str, date: str, time: str, duration: int) -> Optional[Appointment]:
     """
     Helper function to detect time conflicts for a doctor
     
@@ -303,27 +535,18 @@ def check_time_conflict(doctor_name: str, date: str, time: str, duration: int) -
     Returns:
         Conflicting appointment if found, None otherwise
     """
-    # Get all appointments for this doctor on this date
-    doctor_appointments = [
-        apt for apt in APPOINTMENTS_DB
-        if apt["doctorName"] == doctor_name and apt["date"] == date
-        and apt["status"] not in ["Cancelled", "Completed"]
-    ]
-    
-    # Parse new appointment time
-    new_start = datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
-    new_end = new_start + timedelta(minutes=duration)
-    
-    # Check for overlaps
-    for apt in doctor_appointments:
-        existing_start = datetime.strptime(f"{apt['date']} {apt['time']}", "%Y-%m-%d %H:%M")
-        existing_end = existing_start + timedelta(minutes=apt["duration"])
-        
-        # Check if times overlap
-        if (new_start < existing_end) and (new_end > existing_start):
-            return apt
-    
-    return None
+    # Integer minutes-since-midnight; overlap checks are two int compares
+    # instead of two strptime calls per existing appointment
+    new_start = _to_minutes(time)
+    new_end = new_start + duration
+
+    bucket = _INTERVALS.get((doctor_name, date))
+    if bucket is None:
+        return None
+    starts, ends, apts = bucket
+
+    position = _first_overlap(starts, ends, new_start, new_end)
+    return apts[position] if position >= 0 else None
 
 
 def update_appointment_status(appointment_id: str, new_status: str) -> Dict:
@@ -366,19 +589,32 @@ def update_appointment_status(appointment_id: str, new_status: str) -> Dict:
     Raises:
         ValueError: If appointment not found or invalid status
     """
-    valid_statuses = ["Confirmed", "Scheduled", "Upcoming", "Cancelled", "Completed"]
+    if new_status not in _VALID_STATUSES:
+        raise ValueError(_VALID_STATUSES_MSG)
     
-    if new_status not in valid_statuses:
-        raise ValueError(f"Invalid status. Must be one of: {', '.join(valid_statuses)}")
-    
-    # Find appointment
-    for apt in APPOINTMENTS_DB:
-        if apt["id"] == appointment_id:
-            apt["status"] = new_status
-            # In production: Trigger AppSync subscription notification here
-            return apt
-    
-    raise ValueError(f"Appointment with id {appointment_id} not found")
+    # Find appointment via the id index
+    apt = _BY_ID.get(appointment_id)
+    if apt is None:
+        raise ValueError(f"Appointment with id {appointment_id} not found")
+
+    with _DOCTOR_LOCKS[apt.doctorName]:
+        # Re-check under the lock in case a concurrent delete won the race
+        if _BY_ID.get(appointment_id) is not apt:
+            raise ValueError(f"Appointment with id {appointment_id} not found")
+
+        # Keep the interval index in step with whether the appointment still
+        # blocks its doctor's time slot
+        was_active = apt.status not in _INACTIVE
+        apt.status = new_status
+        now_active = new_status not in _INACTIVE
+        if was_active and not now_active:
+            _intervals_remove(apt)
+        elif now_active and not was_active:
+            _intervals_add(apt)
+        _bump_version()
+
+    # In production: Trigger AppSync subscription notification here
+    return apt.to_dict()
 
 
 def delete_appointment(appointment_id: str) -> bool:
@@ -410,13 +646,30 @@ def delete_appointment(appointment_id: str) -> bool:
     Returns:
         True if deleted successfully, False otherwise
     """
-    for i, apt in enumerate(APPOINTMENTS_DB):
-        if apt["id"] == appointment_id:
-            APPOINTMENTS_DB.pop(i)
-            # In production: Trigger AppSync subscription for deletion
-            return True
-    
-    return False
+    apt = _BY_ID.get(appointment_id)
+    if apt is None:
+        return False
+
+    with _DOCTOR_LOCKS[apt.doctorName]:
+        # Re-check under the lock in case a concurrent delete won the race
+        if _BY_ID.pop(appointment_id, None) is not apt:
+            return False
+
+        # Swap the last row into the vacated slot and pop from the tail -
+        # O(1), no memmove of everything after the deleted position
+        position = _POS_BY_ID.pop(appointment_id)
+        last = APPOINTMENTS_DB[-1]
+        if last is not apt:
+            APPOINTMENTS_DB[position] = last
+            _POS_BY_ID[last.id] = position
+        APPOINTMENTS_DB.pop()
+        if apt.status not in _INACTIVE:
+            _intervals_remove(apt)
+        _sorted_remove(apt)
+        _bump_version()
+
+    # In production: Trigger AppSync subscription for deletion
+    return True
 
 
 # Data Consistency Explanation